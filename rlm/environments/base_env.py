@@ -10,7 +10,9 @@ class BaseEnv(ABC):
     """
 
     def __init__(self, **kwargs):
-        self.kwargs = kwargs
+        # Unused keyword arguments are accepted but not retained, so they are not kept alive
+        # for the lifetime of every environment.
+        super().__init__()
 
     @abstractmethod
     def setup(self):
@@ -34,18 +36,6 @@ class IsolatedEnv(BaseEnv, ABC):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
-    @abstractmethod
-    def setup(self):
-        raise NotImplementedError
-
-    @abstractmethod
-    def load_context(self, context_payload: dict | list | str):
-        raise NotImplementedError
-
-    @abstractmethod
-    def execute_code(self, code: str) -> REPLResult:
-        raise NotImplementedError
-
 
 class NonIsolatedEnv(BaseEnv, ABC):
     """
@@ -56,15 +46,3 @@ class NonIsolatedEnv(BaseEnv, ABC):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-
-    @abstractmethod
-    def setup(self):
-        raise NotImplementedError
-
-    @abstractmethod
-    def load_context(self, context_payload: dict | list | str):
-        raise NotImplementedError
-
-    @abstractmethod
-    def execute_code(self, code: str) -> REPLResult:
-        raise NotImplementedError
@@ -2,7 +2,8 @@
 Parsing utilities for RLM trjaectories.
 """
 
-import re
+import functools
+from operator import itemgetter
 from typing import TYPE_CHECKING
 
 from rlm.core.types import REPLResult, RLMIteration
@@ -10,22 +11,116 @@ from rlm.core.types import REPLResult, RLMIteration
 if TYPE_CHECKING:
     from rlm.environments.base_env import BaseEnv
 
+# Responses longer than this are parsed directly rather than pinned in the lookup cache.
+MAX_CACHED_RESPONSE_LENGTH = 200_000
+
+# REPL locals that are never shown in execution results, and the value types that are.
+_EXCLUDED_LOCALS = frozenset({"__builtins__", "__name__", "__doc__"})
+_DISPLAYED_LOCAL_TYPES = (str, int, float, bool, list, dict, tuple)
+
 
 def find_code_blocks(text: str) -> list[str]:
     """
     Find REPL code blocks in text wrapped in triple backticks and return List of content(s).
     Returns None if no code blocks are found.
     """
-    pattern = r"```repl\s*\n(.*?)\n```"
     results = []
-
-    for match in re.finditer(pattern, text, re.DOTALL):
-        code_content = match.group(1).strip()
-        results.append(code_content)
+    pos = 0
+
+    while True:
+        start = text.find("```repl", pos)
+        if start == -1:
+            break
+        newline = text.find("\n", start + 7)
+        if newline == -1:
+            break
+        # The opening fence may only be followed by whitespace up to the newline, so only the
+        # last fence on a line can qualify. Jumping straight to it keeps the scan linear.
+        start = text.rfind("```repl", start, newline)
+        if text[start + 7 : newline].strip():
+            pos = newline
+            continue
+        end = text.find("\n```", newline + 1)
+        if end == -1:
+            break
+        results.append(text[newline + 1 : end].strip())
+        pos = end + 4
 
     return results
 
 
+def starts_line(text: str, index: int) -> bool:
+    """
+    Return True if only whitespace precedes `index` on its line. Only the whitespace run is
+    walked, so repeated checks along one long line stay linear overall.
+    """
+    while index > 0 and text[index - 1] != "\n" and text[index - 1].isspace():
+        index -= 1
+    return index == 0 or text[index - 1] == "\n"
+
+
+def find_call_arguments(text: str, start: int) -> str | None:
+    """
+    Return the stripped text from `start` (just after an opening "(") up to its matching ")".
+    Nested parentheses are balanced, so `FINAL(f(x))` yields `f(x)`.
+    Returns None if the parentheses are never closed.
+    """
+    # Jump between parentheses with str.find rather than stepping through every character.
+    depth = 1
+    pos = start
+    close = text.find(")", start)
+    while close != -1:
+        open_paren = text.find("(", pos, close)
+        if open_paren != -1:
+            depth += 1
+            pos = open_paren + 1
+            continue
+        depth -= 1
+        if depth == 0:
+            return text[start:close].strip()
+        pos = close + 1
+        close = text.find(")", pos)
+    return None
+
+
+def find_final_call(text: str) -> tuple[str, str] | None:
+    """
+    Find a FINAL_VAR(...) or FINAL(...) call that starts a line (ignoring leading whitespace)
+    in a single pass over the text, and return `(tag, arguments)` with tag "FINAL_VAR" or
+    "FINAL". The first FINAL_VAR takes precedence over FINAL, wherever they appear.
+    Returns None if neither is found.
+    """
+    final_var_seen = False
+    final_seen = False
+    final_arguments = None
+    pos = 0
+
+    while not (final_var_seen and final_seen):
+        start = text.find("FINAL", pos)
+        if start == -1:
+            break
+        pos = start + 5
+        if not starts_line(text, start):
+            continue
+        if not final_var_seen and text.startswith("_VAR(", pos):
+            final_var_seen = True
+            arguments = find_call_arguments(text, pos + 5)
+            if arguments is not None:
+                return "FINAL_VAR", arguments
+        elif not final_seen and text.startswith("(", pos):
+            final_seen = True
+            final_arguments = find_call_arguments(text, pos + 1)
+
+    if final_arguments is None:
+        return None
+    return "FINAL", final_arguments
+
+
+# The same response is often parsed more than once (e.g. by the RLM loop and by callers of
+# check_for_final_answer), so memoize the pure text scan. FINAL_VAR lookups are never cached.
+cached_find_final_call = functools.lru_cache(maxsize=512)(find_final_call)
+
+
 def find_final_answer(text: str, environment: "BaseEnv | None" = None) -> str | None:
     """
     Find FINAL(...) or FINAL_VAR(...) statement in response and return the final answer string.
@@ -40,11 +135,19 @@ def find_final_answer(text: str, environment: "BaseEnv | None" = None) -> str |
     Returns:
         The final answer string, or None if no final answer pattern is found
     """
-    # Check for FINAL_VAR pattern first - must be at start of line
-    final_var_pattern = r"^\s*FINAL_VAR\((.*?)\)"
-    match = re.search(final_var_pattern, text, re.MULTILINE | re.DOTALL)
-    if match:
-        variable_name = match.group(1).strip().strip('"').strip("'")
+    # Most intermediate responses have no final answer; one substring scan covers both tags and
+    # keeps those responses out of the lookup cache.
+    if "FINAL" not in text:
+        return None
+
+    scan = cached_find_final_call if len(text) < MAX_CACHED_RESPONSE_LENGTH else find_final_call
+    match = scan(text)
+    if match is None:
+        return None
+    tag, arguments = match
+
+    if tag == "FINAL_VAR":
+        variable_name = arguments.strip(" \t\n\r\"'")
         if environment is not None:
             result = environment.execute_code(f"print(FINAL_VAR({variable_name!r}))")
             final_answer = result.stdout.strip()
@@ -53,13 +156,7 @@ def find_final_answer(text: str, environment: "BaseEnv | None" = None) -> str |
             return final_answer
         return None
 
-    # Check for FINAL pattern - must be at start of line
-    final_pattern = r"^\s*FINAL\((.*?)\)"
-    match = re.search(final_pattern, text, re.MULTILINE | re.DOTALL)
-    if match:
-        return match.group(1).strip()
-
-    return None
+    return arguments
 
 
 def format_iteration(
@@ -77,23 +174,18 @@ def format_iteration(
     Returns:
         A list of messages to add to the next prompt
     """
-    messages = [{"role": "assistant", "content": iteration.response}]
-
-    for code_block in iteration.code_blocks:
-        code = code_block.code
-        result = code_block.result
-        result = format_execution_result(result)
-        if len(result) > max_character_length:
-            result = (
-                result[:max_character_length]
-                + f"... + [{len(result) - max_character_length} chars...]"
-            )
-
-        execution_message = {
+    # Size the list up front (every slot starts as the assistant message) and fill in one
+    # execution message per code block.
+    messages = [{"role": "assistant", "content": iteration.response}] * (
+        len(iteration.code_blocks) + 1
+    )
+
+    for idx, code_block in enumerate(iteration.code_blocks, 1):
+        result = format_execution_result(code_block.result, max_character_length)
+        messages[idx] = {
             "role": "user",
-            "content": f"Code executed:\n```python\n{code}\n```\n\nREPL output:\n{result}",
+            "content": f"Code executed:\n```python\n{code_block.code}\n```\n\nREPL output:\n{result}",
         }
-        messages.append(execution_message)
     return messages
 
 
@@ -102,37 +194,62 @@ def format_iteration(
 ################
 
 
-def format_execution_result(result: REPLResult) -> str:
+def format_execution_result(result: REPLResult, max_character_length: int | None = None) -> str:
     """
     Format the execution result as a string for display.
 
     Args:
         result: The REPLResult object to format.
+        max_character_length: If set, truncate the formatted string to this many characters.
+            stdout/stderr are sliced before being joined, so oversized output is never copied
+            in full.
     """
+    stdout, stderr = result.stdout, result.stderr
+
+    # Show some key variables (excluding internal ones), only simple types
+    important_vars = [
+        key
+        for key, value in result.locals.items()
+        if not key.startswith("_")
+        and key not in _EXCLUDED_LOCALS
+        and isinstance(value, _DISPLAYED_LOCAL_TYPES)
+    ]
+
+    if not stdout and not stderr and not important_vars:
+        return "No output"
+
+    # Common case: only stdout, and it fits, so no parts list is needed.
+    if not stderr and not important_vars:
+        if max_character_length is None or len(stdout) < max_character_length:
+            return f"\n{stdout}"
+
+    # Sections are kept as separate pieces so the total length is known without concatenating
+    # them. Outputs never get copied to prepend a newline: each is preceded by one prefix piece
+    # holding its "\n" plus the "\n\n" separator when it follows another section.
     result_parts = []
 
-    if result.stdout:
-        result_parts.append(f"\n{result.stdout}")
-
-    if result.stderr:
-        result_parts.append(f"\n{result.stderr}")
-
-    # Show some key variables (excluding internal ones)
-    important_vars = {}
-    for key, value in result.locals.items():
-        if not key.startswith("_") and key not in [
-            "__builtins__",
-            "__name__",
-            "__doc__",
-        ]:
-            # Only show simple types or short representations
-            if isinstance(value, (str, int, float, bool, list, dict, tuple)):
-                important_vars[key] = ""
+    for output in (stdout, stderr):
+        if output:
+            result_parts.append("\n\n\n" if result_parts else "\n")
+            result_parts.append(output)
 
     if important_vars:
-        result_parts.append(f"REPL variables: {list(important_vars.keys())}\n")
+        separator = "\n\n" if result_parts else ""
+        result_parts.append(f"{separator}REPL variables: {important_vars}\n")
+
+    total_length = sum(map(len, result_parts))
+    if max_character_length is None or total_length <= max_character_length:
+        return "".join(result_parts)
 
-    return "\n\n".join(result_parts) if result_parts else "No output"
+    truncated_parts = []
+    remaining = max_character_length
+    for part in result_parts:
+        if remaining <= 0:
+            break
+        truncated_parts.append(part[:remaining])
+        remaining -= len(part)
+    truncated_parts.append(f"... + [{total_length - max_character_length} chars...]")
+    return "".join(truncated_parts)
 
 
 def check_for_final_answer(response: str, repl_env, logger) -> str | None:
@@ -145,24 +262,14 @@ def convert_context_for_repl(context):
     """
     Convert REPL context to either some
     """
-    if isinstance(context, dict):
-        context_data = context
-        context_str = None
-    elif isinstance(context, str):
-        context_data = None
-        context_str = context
-    elif isinstance(context, list):
-        if len(context) > 0 and isinstance(context[0], dict):
-            if "content" in context[0]:
-                context_data = [msg.get("content", "") for msg in context]
-            else:
-                context_data = context
-            context_str = None
-        else:
-            context_data = context
-            context_str = None
-    else:
-        context_data = context
-        context_str = None
-
-    return context_data, context_str
+    # dicts, plain lists and any other payload are passed through as data unchanged.
+    if isinstance(context, str):
+        return None, context
+    if isinstance(context, list) and context and isinstance(context[0], dict):
+        if "content" in context[0]:
+            try:
+                return list(map(itemgetter("content"), context)), None
+            except KeyError:
+                # Some later message lacks "content"; fall back to an empty string for it.
+                return [msg.get("content", "") for msg in context], None
+    return context, None
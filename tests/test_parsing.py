@@ -62,6 +62,11 @@ y = 2
         assert len(blocks) == 1
         assert "y = 2" in blocks[0]
 
+    def test_only_last_fence_on_line_opens_block(self):
+        text = "```repl ignored ```repl\nz = 3\n```"
+        blocks = find_code_blocks(text)
+        assert blocks == ["z = 3"]
+
     def test_multiline_code_block(self):
         text = """```repl
 def factorial(n):
@@ -128,6 +133,21 @@ multiline answer)"""
         result = find_final_answer(text)
         assert result == "answer with spaces"
 
+    def test_final_with_nested_parentheses(self):
+        text = "Done.\nFINAL(max(len(a), 3))"
+        result = find_final_answer(text)
+        assert result == "max(len(a), 3)"
+
+    def test_final_with_unclosed_parentheses(self):
+        text = "FINAL(still typing"
+        result = find_final_answer(text)
+        assert result is None
+
+    def test_final_in_very_long_response(self):
+        text = "x" * 250_000 + "\nFINAL(done)"
+        assert find_final_answer(text) == "done"
+        assert find_final_answer(text) == "done"
+
     def test_final_and_final_var_parsing(self):
         """Test that both FINAL and FINAL_VAR patterns are parsed correctly."""
         # Test FINAL with various content types
@@ -154,6 +174,7 @@ multiline answer)"""
             ("FINAL_VAR('my_var')", "my_var"),
             ('FINAL_VAR("another_var")', "another_var"),
             ("FINAL_VAR(answer)", "answer"),
+            ('FINAL_VAR( "spaced_var" )', "spaced_var"),
         ]
 
         for text, var_name in test_cases_final_var:
@@ -271,6 +292,15 @@ class TestFormatExecutionResult:
         formatted = format_execution_result(result)
         assert formatted == "No output"
 
+    def test_truncates_to_max_character_length(self):
+        result = REPLResult(stdout="a" * 50, stderr="b" * 50, locals={})
+        formatted = format_execution_result(result, max_character_length=60)
+        assert formatted == "\n" + "a" * 50 + "\n\n\n" + "b" * 6 + "... + [44 chars...]"
+
+    def test_no_truncation_within_limit(self):
+        result = REPLResult(stdout="short", stderr="", locals={})
+        assert format_execution_result(result, max_character_length=100) == "\nshort"
+
 
 class TestFormatIteration:
     """Tests for format_iteration function."""
@@ -337,3 +367,12 @@ class TestConvertContextForRepl:
         context_data, context_str = convert_context_for_repl(messages)
         assert context_data == ["Hello", "World"]
         assert context_str is None
+
+    def test_list_of_message_dicts_missing_content(self):
+        messages = [
+            {"role": "user", "content": "Hello"},
+            {"role": "assistant"},
+        ]
+        context_data, context_str = convert_context_for_repl(messages)
+        assert context_data == ["Hello", ""]
+        assert context_str is None